@@ -4,22 +4,44 @@ Uses tool-calling to check slots and book appointments
 """
 
 import os
+import asyncio
 import logging
-from typing import Dict, List
+import threading
+from collections import deque
+from typing import Deque, List, Optional, Tuple
 
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from cachetools import TTLCache
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 from app.llm.provider import get_llm
 from app.agent.tools import CLINIC_TOOLS
 from app.agent.prompts import SYSTEM_PROMPT, is_urgent
 from app.database.db import get_db_session
-from app.database.models import Conversation
+from app.database.models import Conversation, Patient
+from app.whatsapp.client import get_whatsapp_client
 
 logger = logging.getLogger(__name__)
 
-# Per-phone conversation memory (in-memory for MVP)
-_conversations: Dict[str, List] = {}
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "10000"))
+MEMORY_TTL_SECONDS = int(os.getenv("MEMORY_TTL_SECONDS", "3600"))
+MEMORY_MAX_MESSAGES = 20
+
+# Per-phone conversation memory (in-memory for MVP), bounded and expired when idle
+_conversations: TTLCache = TTLCache(maxsize=MEMORY_MAX_SESSIONS, ttl=MEMORY_TTL_SECONDS)
+
+# Resolved patient ids by phone; only hits are cached since a patient may book later
+_patient_ids: TTLCache = TTLCache(maxsize=MEMORY_MAX_SESSIONS, ttl=MEMORY_TTL_SECONDS)
+_patient_ids_lock = threading.Lock()
+
+CONVERSATION_BATCH_SIZE = 100
+CONVERSATION_FLUSH_SECONDS = 0.05
+
+# Batched conversation writer state (set while run_conversation_writer is running)
+_conv_queue: Optional[asyncio.Queue] = None
+_conv_loop: Optional[asyncio.AbstractEventLoop] = None
+# Held while routing a turn to the queue, so shutdown can't slip between check and hand-off
+_conv_route_lock = threading.Lock()
 
 # Lazy-initialized agent
 _agent_executor = None
@@ -40,11 +62,38 @@ def _get_agent():
     return _agent_executor
 
 
-def _get_history(phone: str) -> List:
+def _get_history(phone: str) -> Deque:
     """Get or create message history for a phone number"""
-    if phone not in _conversations:
-        _conversations[phone] = []
-    return _conversations[phone]
+    history = _conversations.get(phone)
+    if history is None:
+        # TTLCache has no atomic setdefault; an explicit set also starts the TTL
+        history = _conversations[phone] = deque(maxlen=MEMORY_MAX_MESSAGES)
+    return history
+
+
+URGENT_RESPONSE = (
+    "URGENT: Based on your symptoms, this may be an emergency. "
+    "Please call emergency services (115) or go to the nearest hospital immediately. "
+    "Do not wait for an appointment."
+)
+
+FALLBACK_RESPONSE = "I'm sorry, I couldn't process that. Could you please try again?"
+ERROR_RESPONSE = "I'm sorry, I encountered an error. Please try again or contact the clinic directly."
+
+
+def _extract_response(response_messages: list) -> str:
+    """Pick the assistant's final (non tool-calling) reply from the agent output"""
+    for msg in reversed(response_messages):
+        if isinstance(msg, AIMessage) and msg.content and not msg.tool_calls:
+            return msg.content
+    return FALLBACK_RESPONSE
+
+
+def _remember_response(phone: str, history: Deque, ai_response: str):
+    """Append the AI response to history (the deque keeps only the most recent messages)"""
+    history.append(AIMessage(content=ai_response))
+    # Re-assigning refreshes the session's TTL, so only idle sessions expire
+    _conversations[phone] = history
 
 
 def chat_with_agent(phone: str, message: str) -> str:
@@ -61,13 +110,8 @@ def chat_with_agent(phone: str, message: str) -> str:
     try:
         # Check for emergency keywords first
         if is_urgent(message):
-            response = (
-                "URGENT: Based on your symptoms, this may be an emergency. "
-                "Please call emergency services (115) or go to the nearest hospital immediately. "
-                "Do not wait for an appointment."
-            )
-            _save_conversation(phone, f"Patient: {message}\nAgent: {response}")
-            return response
+            _save_conversation(phone, message, URGENT_RESPONSE)
+            return URGENT_RESPONSE
 
         # Build messages for the agent
         history = _get_history(phone)
@@ -76,55 +120,84 @@ def chat_with_agent(phone: str, message: str) -> str:
         agent = _get_agent()
 
         # Invoke the agent with full conversation history
-        result = agent.invoke({"messages": history})
+        input_messages = list(history)
+        result = agent.invoke({"messages": input_messages})
 
-        # Extract the assistant's final response
         response_messages = result.get("messages", [])
-        ai_response = ""
-        for msg in reversed(response_messages):
-            if isinstance(msg, AIMessage) and msg.content and not msg.tool_calls:
-                ai_response = msg.content
-                break
-
-        if not ai_response:
-            ai_response = "I'm sorry, I couldn't process that. Could you please try again?"
-
-        # Update history with the AI response
-        history.append(AIMessage(content=ai_response))
-
-        # Keep history manageable (last 20 messages)
-        if len(history) > 20:
-            _conversations[phone] = history[-20:]
+        # Only messages produced on this turn can carry a new booking
+        turn_messages = response_messages[len(input_messages):]
+        ai_response = _extract_response(response_messages)
+        _remember_response(phone, history, ai_response)
 
         # Persist to database
-        _save_conversation(phone, f"Patient: {message}\nAgent: {ai_response}")
+        _save_conversation(phone, message, ai_response)
 
         # Send doctor notification if an appointment was just booked
-        _check_and_notify_doctor(response_messages, phone)
+        _check_and_notify_doctor(turn_messages, phone)
 
         return ai_response
 
     except Exception as e:
         logger.error(f"Error in chat_with_agent: {e}", exc_info=True)
-        return "I'm sorry, I encountered an error. Please try again or contact the clinic directly."
+        return ERROR_RESPONSE
+
+
+async def achat_with_agent(phone: str, message: str) -> str:
+    """
+    Async variant of chat_with_agent for callers running on the event loop.
+
+    The LLM call is awaited instead of blocking the loop, and the DB save and
+    doctor notification (both blocking I/O) run concurrently in worker threads.
+    """
+    try:
+        if is_urgent(message):
+            await asyncio.to_thread(_save_conversation, phone, message, URGENT_RESPONSE)
+            return URGENT_RESPONSE
+
+        history = _get_history(phone)
+        history.append(HumanMessage(content=message))
+
+        agent = _get_agent()
+        input_messages = list(history)
+        result = await agent.ainvoke({"messages": input_messages})
+
+        response_messages = result.get("messages", [])
+        # Only messages produced on this turn can carry a new booking
+        turn_messages = response_messages[len(input_messages):]
+        ai_response = _extract_response(response_messages)
+        _remember_response(phone, history, ai_response)
+
+        await asyncio.gather(
+            asyncio.to_thread(_save_conversation, phone, message, ai_response),
+            asyncio.to_thread(_check_and_notify_doctor, turn_messages, phone),
+        )
+
+        return ai_response
+
+    except Exception as e:
+        logger.error(f"Error in achat_with_agent: {e}", exc_info=True)
+        return ERROR_RESPONSE
 
 
 def _check_and_notify_doctor(messages: list, phone: str):
-    """Check if an appointment was booked and notify the doctor"""
+    """Check if an appointment was booked this turn and notify the doctor"""
     for msg in messages:
-        if hasattr(msg, "content") and isinstance(msg.content, str):
-            if "Appointment confirmed!" in msg.content:
-                try:
-                    _send_doctor_notification(msg.content, phone)
-                except Exception as e:
-                    logger.error(f"Failed to send doctor notification: {e}")
-                break
+        # book_appointment's reply already has the formatted date/time, so it is forwarded as-is
+        if (
+            isinstance(msg, ToolMessage)
+            and msg.name == "book_appointment"
+            and isinstance(msg.content, str)
+            and msg.content.startswith("Appointment confirmed!")
+        ):
+            try:
+                _send_doctor_notification(msg.content, phone)
+            except Exception as e:
+                logger.error(f"Failed to send doctor notification: {e}")
+            break
 
 
 def _send_doctor_notification(booking_details: str, patient_phone: str):
     """Send appointment notification to doctor's WhatsApp"""
-    from app.whatsapp.client import get_whatsapp_client
-
     doctor_whatsapp = os.getenv("PERSONAL_WHATSAPP", "")
     if not doctor_whatsapp:
         return
@@ -141,25 +214,82 @@ def _send_doctor_notification(booking_details: str, patient_phone: str):
     logger.info("Doctor notification sent")
 
 
-def _save_conversation(phone: str, transcript: str):
-    """Save conversation turn to database"""
+def _save_conversation(phone: str, message: str, response: str):
+    """Queue a conversation turn for the batch writer, or write it directly if it isn't running"""
+    turn = (phone, message, response)
+    with _conv_route_lock:
+        if _conv_queue is not None:
+            # May be called from worker threads, so hand off to the writer's loop
+            _conv_loop.call_soon_threadsafe(_conv_queue.put_nowait, turn)
+            return
+    _write_conversations([turn])
+
+
+def _write_conversations(turns: List[Tuple[str, str, str]]):
+    """Save conversation turns to database in a single commit"""
     try:
         db = get_db_session()
         try:
-            from app.database.models import Patient
-            patient = db.query(Patient).filter(Patient.phone == phone).first()
-
-            conversation = Conversation(
-                patient_id=patient.id if patient else None,
-                phone=phone,
-                transcript=transcript,
-            )
-            db.add(conversation)
+            with _patient_ids_lock:
+                patient_ids = {phone: _patient_ids.get(phone) for phone, _, _ in turns}
+            unresolved = [phone for phone, patient_id in patient_ids.items() if patient_id is None]
+
+            if unresolved:
+                found = dict(
+                    db.query(Patient.phone, Patient.id).filter(Patient.phone.in_(unresolved)).all()
+                )
+                patient_ids.update(found)
+                with _patient_ids_lock:
+                    _patient_ids.update(found)
+
+            db.add_all([
+                Conversation(
+                    patient_id=patient_ids.get(phone),
+                    phone=phone,
+                    transcript=f"Patient: {message}\nAgent: {response}",
+                )
+                for phone, message, response in turns
+            ])
             db.commit()
         finally:
             db.close()
     except Exception as e:
-        logger.error(f"Failed to save conversation: {e}")
+        logger.error(f"Failed to save {len(turns)} conversation turn(s): {e}")
+
+
+async def run_conversation_writer():
+    """Background task: batch queued conversation turns into one commit per flush"""
+    global _conv_queue, _conv_loop
+    queue: asyncio.Queue = asyncio.Queue()
+    _conv_loop = asyncio.get_running_loop()
+    _conv_queue = queue
+    logger.info("Conversation writer started")
+
+    pending: List[Tuple[str, str, str]] = []
+    try:
+        while True:
+            pending.append(await queue.get())
+
+            # Give concurrent turns a moment to arrive, then take what's there
+            await asyncio.sleep(CONVERSATION_FLUSH_SECONDS)
+            while len(pending) < CONVERSATION_BATCH_SIZE and not queue.empty():
+                pending.append(queue.get_nowait())
+
+            batch, pending = pending, []
+            await asyncio.to_thread(_write_conversations, batch)
+    finally:
+        # Turns saved from now on go to the direct write path
+        with _conv_route_lock:
+            _conv_queue = None
+        # Let put_nowait callbacks already scheduled from worker threads land first
+        try:
+            await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            pass
+        while not queue.empty():
+            pending.append(queue.get_nowait())
+        if pending:
+            _write_conversations(pending)
 
 
 def clear_memory(phone: str):
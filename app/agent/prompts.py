@@ -3,6 +3,8 @@ System prompts and urgency detection for AI Clinic Receptionist
 Supports English and Roman Urdu
 """
 
+import re
+
 SYSTEM_PROMPT = """You are a professional, warm, and empathetic medical clinic receptionist AI in Pakistan. Your job is to help patients book appointments through natural conversation.
 
 COMMUNICATION RULES:
@@ -65,7 +67,28 @@ URGENCY_KEYWORDS = [
 ]
 
 
+def _build_urgency_matcher():
+    """
+    Build the keyword matcher once at import.
+    Uses an Aho-Corasick automaton when pyahocorasick is installed (one pass
+    over the text regardless of keyword count), else a compiled regex.
+    """
+    try:
+        import ahocorasick
+    except ImportError:
+        pattern = re.compile("|".join(re.escape(keyword) for keyword in URGENCY_KEYWORDS))
+        return lambda text_lower: pattern.search(text_lower) is not None
+
+    automaton = ahocorasick.Automaton()
+    for keyword in URGENCY_KEYWORDS:
+        automaton.add_word(keyword.lower(), keyword)
+    automaton.make_automaton()
+    return lambda text_lower: next(automaton.iter(text_lower), None) is not None
+
+
+_matches_urgency = _build_urgency_matcher()
+
+
 def is_urgent(text: str) -> bool:
     """Check if message contains urgent/emergency symptoms"""
-    text_lower = text.lower()
-    return any(keyword in text_lower for keyword in URGENCY_KEYWORDS)
+    return _matches_urgency(text.lower())
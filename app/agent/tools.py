@@ -5,9 +5,14 @@ Clinic hours: configurable via env (default 10am-8pm, 30-min slots)
 
 import os
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime, date, time, timedelta
-from typing import List
+from typing import Callable, List, Tuple
 from langchain_core.tools import tool
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
 
 from app.database.models import Patient, Appointment
 from app.database.db import get_db_session
@@ -35,6 +40,78 @@ def generate_time_slots() -> List[time]:
     return slots
 
 
+# Clinic hours are fixed for the process lifetime, so the slot grid is built once
+_ALL_SLOTS = tuple(generate_time_slots())
+_ALL_SLOTS_SET = frozenset(_ALL_SLOTS)
+_SLOT_LABELS = {slot: slot.strftime("%I:%M %p") for slot in _ALL_SLOTS}
+
+SLOT_CACHE_SIZE = 64
+
+# Free slots per (date, bookings version). Any appointment change bumps the
+# version, so a result computed before a concurrent booking is never served.
+_slot_cache: "OrderedDict[Tuple[date, int], Tuple[time, ...]]" = OrderedDict()
+_slot_cache_lock = threading.Lock()
+_bookings_version = 0
+
+
+def invalidate_slot_cache():
+    """Mark cached availability stale"""
+    global _bookings_version
+    with _slot_cache_lock:
+        _bookings_version += 1
+        _slot_cache.clear()
+
+
+# Callbacks run after any appointment change (e.g. to wake the reminder service)
+_change_listeners: List[Callable[[], None]] = []
+
+
+def add_appointment_listener(callback: Callable[[], None]):
+    """Register a callback for appointment changes. It may be invoked from worker threads"""
+    _change_listeners.append(callback)
+
+
+def remove_appointment_listener(callback: Callable[[], None]):
+    if callback in _change_listeners:
+        _change_listeners.remove(callback)
+
+
+def notify_appointments_changed():
+    """Call after any appointment insert or status change"""
+    invalidate_slot_cache()
+    for callback in list(_change_listeners):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Appointment listener failed: {e}")
+
+
+def _get_free_slots(db: Session, target_date: date) -> Tuple[time, ...]:
+    """Return free slots for a date, hitting the DB only on a cache miss"""
+    with _slot_cache_lock:
+        key = (target_date, _bookings_version)
+        cached = _slot_cache.get(key)
+        if cached is not None:
+            _slot_cache.move_to_end(key)
+            return cached
+
+    booked_times = {
+        booked_time
+        for (booked_time,) in db.query(Appointment.time).filter(
+            Appointment.date == target_date,
+            Appointment.status.in_(["pending", "confirmed"]),
+        )
+    }
+    available = tuple(sorted(_ALL_SLOTS_SET - booked_times))
+
+    with _slot_cache_lock:
+        if key[1] == _bookings_version:
+            _slot_cache[key] = available
+            if len(_slot_cache) > SLOT_CACHE_SIZE:
+                _slot_cache.popitem(last=False)
+    return available
+
+
 @tool
 def get_available_slots(appointment_date: str) -> str:
     """
@@ -47,26 +124,19 @@ def get_available_slots(appointment_date: str) -> str:
         String listing available time slots, or an error message
     """
     try:
-        target_date = datetime.strptime(appointment_date, "%Y-%m-%d").date()
+        target_date = date.fromisoformat(appointment_date)
 
         if target_date < date.today():
             return "Sorry, cannot book appointments for past dates. Please choose today or a future date."
 
-        all_slots = generate_time_slots()
-
         db = get_db_session()
         try:
-            booked = db.query(Appointment).filter(
-                Appointment.date == target_date,
-                Appointment.status.in_(["pending", "confirmed"]),
-            ).all()
-            booked_times = {apt.time for apt in booked}
-            available = [s for s in all_slots if s not in booked_times]
+            available = _get_free_slots(db, target_date)
 
             if not available:
                 return f"No slots available on {appointment_date}. Please try another date."
 
-            slot_strings = [s.strftime("%I:%M %p") for s in available]
+            slot_strings = [_SLOT_LABELS[s] for s in available]
             return f"Available slots on {appointment_date}:\n" + "\n".join(slot_strings)
         finally:
             db.close()
@@ -78,6 +148,37 @@ def get_available_slots(appointment_date: str) -> str:
         return "Sorry, error checking availability. Please try again."
 
 
+# Dialects with INSERT ... ON CONFLICT DO NOTHING ... RETURNING support
+_UPSERT_BY_DIALECT = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def _get_or_create_patient_id(db: Session, name: str, phone: str, age: int) -> int:
+    """Return the patient's id, inserting them first if this phone is new"""
+    upsert = _UPSERT_BY_DIALECT.get(db.get_bind().dialect.name)
+    if upsert is None:
+        patient = db.query(Patient).filter(Patient.phone == phone).first()
+        if not patient:
+            patient = Patient(name=name, phone=phone, age=age)
+            db.add(patient)
+            db.flush()
+        return patient.id
+
+    patient_id = db.execute(
+        upsert(Patient)
+        .values(name=name, phone=phone, age=age)
+        .on_conflict_do_nothing(index_elements=[Patient.phone])
+        .returning(Patient.id)
+    ).scalar()
+
+    # No row returned means the patient already existed
+    if patient_id is None:
+        patient_id = db.execute(select(Patient.id).where(Patient.phone == phone)).scalar_one()
+    return patient_id
+
+
 @tool
 def book_appointment(name: str, phone: str, age: int, appointment_date: str, appointment_time: str, reason: str) -> str:
     """
@@ -95,38 +196,36 @@ def book_appointment(name: str, phone: str, age: int, appointment_date: str, app
         Confirmation message or error
     """
     try:
-        target_date = datetime.strptime(appointment_date, "%Y-%m-%d").date()
+        target_date = date.fromisoformat(appointment_date)
         target_time = datetime.strptime(appointment_time, "%H:%M").time()
 
         db = get_db_session()
         try:
-            # Find or create patient
-            patient = db.query(Patient).filter(Patient.phone == phone).first()
-            if not patient:
-                patient = Patient(name=name, phone=phone, age=age)
-                db.add(patient)
-                db.flush()
-
             # Check slot availability
-            existing = db.query(Appointment).filter(
-                Appointment.date == target_date,
-                Appointment.time == target_time,
-                Appointment.status.in_(["pending", "confirmed"]),
-            ).first()
-
-            if existing:
+            slot_taken = db.query(
+                db.query(Appointment.id).filter(
+                    Appointment.date == target_date,
+                    Appointment.time == target_time,
+                    Appointment.status.in_(["pending", "confirmed"]),
+                ).exists()
+            ).scalar()
+
+            if slot_taken:
                 return f"Sorry, {appointment_time} on {appointment_date} was just booked. Please choose another time."
 
-            # Book it
-            appointment = Appointment(
-                patient_id=patient.id,
-                date=target_date,
-                time=target_time,
-                reason=reason,
-                status="confirmed",
+            # Find or create patient, then book it in the same transaction
+            patient_id = _get_or_create_patient_id(db, name, phone, age)
+            db.execute(
+                insert(Appointment).values(
+                    patient_id=patient_id,
+                    date=target_date,
+                    time=target_time,
+                    reason=reason,
+                    status="confirmed",
+                )
             )
-            db.add(appointment)
             db.commit()
+            notify_appointments_changed()
 
             friendly_time = target_time.strftime("%I:%M %p")
             friendly_date = target_date.strftime("%A, %B %d, %Y")
@@ -3,16 +3,17 @@ FastAPI Routes - Appointments API and Doctor Dashboard
 """
 
 import logging
-from datetime import date, datetime
+from datetime import date
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import FileResponse
+from sqlalchemy import case, func, lambda_stmt, select
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from app.database.db import get_db
 from app.database.models import Appointment, Patient
-from app.whatsapp.handler import get_whatsapp_handler
+from app.agent.tools import notify_appointments_changed
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +31,7 @@ class AppointmentResponse(BaseModel):
     status: str
     created_at: str
 
-    model_config = {"from_attributes": True}
+    model_config = ConfigDict(from_attributes=True)
 
 
 class AppointmentUpdate(BaseModel):
@@ -51,33 +52,46 @@ async def get_appointments(
 ):
     """Get all appointments with optional filters"""
     try:
-        query = db.query(Appointment).join(Patient)
+        # Project only the columns the dashboard needs - no ORM entities are built.
+        # lambda_stmt caches the constructed statement; filter values become bound params.
+        stmt = lambda_stmt(
+            lambda: select(
+                Appointment.id,
+                Patient.name,
+                Patient.phone,
+                Patient.age,
+                Appointment.date,
+                Appointment.time,
+                Appointment.reason,
+                Appointment.status,
+                Appointment.created_at,
+            ).join(Patient)
+        )
 
         if date_filter:
-            filter_date = datetime.strptime(date_filter, "%Y-%m-%d").date()
-            query = query.filter(Appointment.date == filter_date)
+            filter_date = date.fromisoformat(date_filter)
+            stmt += lambda s: s.where(Appointment.date == filter_date)
 
         if status:
-            query = query.filter(Appointment.status == status)
+            stmt += lambda s: s.where(Appointment.status == status)
 
-        appointments = query.order_by(
-            Appointment.date.desc(),
-            Appointment.time.desc(),
-        ).all()
+        stmt += lambda s: s.order_by(Appointment.date.desc(), Appointment.time.desc())
+        rows = db.execute(stmt).all()
 
+        # Plain dicts of ISO strings; FastAPI validates and serializes them via the response model
         return [
-            AppointmentResponse(
-                id=apt.id,
-                patient_name=apt.patient.name,
-                patient_phone=apt.patient.phone,
-                patient_age=apt.patient.age,
-                date=apt.date.strftime("%Y-%m-%d"),
-                time=apt.time.strftime("%H:%M"),
-                reason=apt.reason,
-                status=apt.status,
-                created_at=apt.created_at.isoformat(),
-            )
-            for apt in appointments
+            {
+                "id": row.id,
+                "patient_name": row.name,
+                "patient_phone": row.phone,
+                "patient_age": row.age,
+                "date": row.date.isoformat(),
+                "time": row.time.isoformat(timespec="minutes"),
+                "reason": row.reason,
+                "status": row.status,
+                "created_at": row.created_at.isoformat(),
+            }
+            for row in rows
         ]
 
     except ValueError:
@@ -102,6 +116,7 @@ async def update_appointment(
 
         appointment.status = update.status
         db.commit()
+        notify_appointments_changed()
 
         logger.info(f"Appointment {appointment_id} updated to {update.status}")
         return {"message": "Appointment updated successfully", "id": appointment_id}
@@ -119,25 +134,29 @@ async def get_today_stats(db: Session = Depends(get_db)):
     """Get today's appointment stats"""
     try:
         today = date.today()
-        total = db.query(Appointment).filter(Appointment.date == today).count()
-        pending = db.query(Appointment).filter(
-            Appointment.date == today,
-            Appointment.status == "pending",
-        ).count()
+        # One round-trip: total and pending counts via a conditional aggregate
+        row = db.execute(
+            lambda_stmt(
+                lambda: select(
+                    func.count().label("total"),
+                    func.sum(case((Appointment.status == "pending", 1), else_=0)).label("pending"),
+                ).where(Appointment.date == today)
+            )
+        ).one()
 
-        return {"total_today": total, "pending_today": pending}
+        return {"total_today": row.total, "pending_today": int(row.pending or 0)}
     except Exception as e:
         logger.error(f"Error fetching today's stats: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch stats")
 
 
 @router.post("/api/chat")
-async def chat_endpoint(phone: str, message: str):
+async def chat_endpoint(request: Request, phone: str, message: str):
     """Chat endpoint for testing via API (without WhatsApp)"""
     try:
-        handler = get_whatsapp_handler()
-        response = handler.process_message(phone=phone, message=message)
-        return {"response": response}
+        handler = request.app.state.handler
+        response, delivered = await handler.areply(phone=phone, message=message)
+        return {"response": response, "delivered": delivered}
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Failed to process message")
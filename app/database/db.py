@@ -4,7 +4,7 @@ Database setup and session management
 
 import os
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
 from dotenv import load_dotenv
 
@@ -15,11 +15,34 @@ logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///clinic.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-    echo=False,
-)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+if IS_SQLITE:
+    # File-backed SQLite gets SQLAlchemy's default QueuePool; WAL (below) lets
+    # readers proceed while a write is in progress
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        echo=False,
+    )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=int(os.getenv("SQLALCHEMY_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", "20")),
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        echo=False,
+    )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -35,12 +58,9 @@ def init_db():
 
 
 def get_db() -> Session:
-    """Get database session - FastAPI dependency"""
-    db = SessionLocal()
-    try:
+    """Get database session - FastAPI dependency (closed when the request ends)"""
+    with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 def get_db_session() -> Session:
@@ -1,11 +1,13 @@
 """
 Database models for AI Clinic Receptionist
-SQLAlchemy ORM models
+SQLAlchemy ORM models (2.0 typed declarative style)
 """
 
+import datetime as dt
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Date, Time
-from sqlalchemy.orm import DeclarativeBase, relationship
+from typing import List, Optional
+from sqlalchemy import String, ForeignKey, Text, Index
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
 class Base(DeclarativeBase):
@@ -16,15 +18,15 @@ class Patient(Base):
     """Patient information"""
     __tablename__ = "patients"
 
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
-    phone = Column(String(20), unique=True, nullable=False, index=True)
-    age = Column(Integer, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    name: Mapped[str] = mapped_column(String(100))
+    phone: Mapped[str] = mapped_column(String(20), unique=True, index=True)
+    age: Mapped[Optional[int]]
+    created_at: Mapped[Optional[datetime]] = mapped_column(default=datetime.utcnow)
 
     # Relationships
-    appointments = relationship("Appointment", back_populates="patient")
-    conversations = relationship("Conversation", back_populates="patient")
+    appointments: Mapped[List["Appointment"]] = relationship(back_populates="patient")
+    conversations: Mapped[List["Conversation"]] = relationship(back_populates="patient")
 
     def __repr__(self):
         return f"<Patient(id={self.id}, name='{self.name}', phone='{self.phone}')>"
@@ -33,18 +35,24 @@ class Patient(Base):
 class Appointment(Base):
     """Appointment information"""
     __tablename__ = "appointments"
-
-    id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
-    date = Column(Date, nullable=False, index=True)
-    time = Column(Time, nullable=False)
-    reason = Column(Text, nullable=True)
-    status = Column(String(20), default="pending")  # pending, confirmed, completed, cancelled
-    created_at = Column(DateTime, default=datetime.utcnow)
-    reminder_sent = Column(DateTime, nullable=True)
+    __table_args__ = (
+        # Availability checks and daily stats filter on date + status together
+        Index("ix_appt_date_status", "date", "status"),
+        # Reminder loop: date == tomorrow AND reminder_sent IS NULL
+        Index("ix_appt_reminder_date", "date", "reminder_sent"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    patient_id: Mapped[int] = mapped_column(ForeignKey("patients.id"), index=True)
+    date: Mapped[dt.date] = mapped_column(index=True)
+    time: Mapped[dt.time]
+    reason: Mapped[Optional[str]] = mapped_column(Text)
+    status: Mapped[Optional[str]] = mapped_column(String(20), default="pending")  # pending, confirmed, completed, cancelled
+    created_at: Mapped[Optional[datetime]] = mapped_column(default=datetime.utcnow)
+    reminder_sent: Mapped[Optional[datetime]]
 
     # Relationships
-    patient = relationship("Patient", back_populates="appointments")
+    patient: Mapped["Patient"] = relationship(back_populates="appointments")
 
     def __repr__(self):
         return f"<Appointment(id={self.id}, patient_id={self.patient_id}, date={self.date}, time={self.time}, status='{self.status}')>"
@@ -54,14 +62,14 @@ class Conversation(Base):
     """Conversation history"""
     __tablename__ = "conversations"
 
-    id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=True)
-    phone = Column(String(20), nullable=False, index=True)
-    transcript = Column(Text, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    patient_id: Mapped[Optional[int]] = mapped_column(ForeignKey("patients.id"), index=True)
+    phone: Mapped[str] = mapped_column(String(20), index=True)
+    transcript: Mapped[str] = mapped_column(Text)
+    timestamp: Mapped[Optional[datetime]] = mapped_column(default=datetime.utcnow, index=True)
 
     # Relationships
-    patient = relationship("Patient", back_populates="conversations")
+    patient: Mapped[Optional["Patient"]] = relationship(back_populates="conversations")
 
     def __repr__(self):
         return f"<Conversation(id={self.id}, phone='{self.phone}', timestamp={self.timestamp})>"
@@ -4,16 +4,19 @@ LLM Provider - Gemini or Groq via LangChain
 
 import os
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
 def get_llm():
     """
     Get LLM instance based on LLM_PROVIDER env var.
     Returns a LangChain chat model (Gemini or Groq).
+    The client is built once per process and reused, along with its HTTP pool.
     """
     provider = os.getenv("LLM_PROVIDER", "gemini").lower()
 
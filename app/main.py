@@ -7,13 +7,17 @@ import os
 import sys
 import logging
 import asyncio
+import threading
 from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
 from contextlib import asynccontextmanager
 
 # Add project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import uvicorn
+from sqlalchemy import lambda_stmt, select, update
+from sqlalchemy.orm import contains_eager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
@@ -31,53 +35,159 @@ from app.database.db import init_db, get_db_session
 from app.database.models import Appointment, Patient
 from app.api.routes import router
 from app.whatsapp.handler import get_whatsapp_handler
+from app.whatsapp.client import close_whatsapp_client
+from app.agent.clinic_agent import run_conversation_writer
+from app.agent.tools import add_appointment_listener, remove_appointment_listener
+from app.speech.stt import get_stt
+from app.speech.tts import get_tts
 
 
-async def send_reminders_loop():
-    """Background task: send appointment reminders 24h in advance"""
-    logger.info("Reminder service started")
+REMINDER_RETRY_SECONDS = int(os.getenv("REMINDER_RETRY_SECONDS", "900"))
 
-    while True:
-        try:
-            tomorrow = datetime.now().date() + timedelta(days=1)
-            db = get_db_session()
-            try:
-                appointments = (
-                    db.query(Appointment)
-                    .join(Patient)
-                    .filter(
-                        Appointment.date == tomorrow,
-                        Appointment.status.in_(["pending", "confirmed"]),
-                        Appointment.reminder_sent.is_(None),
+
+def _seconds_until_midnight() -> float:
+    """Seconds until the local date rolls over (when 'tomorrow' changes)"""
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (midnight - now).total_seconds() + 1
+
+
+def _deliver_reminders(handler, reminders: List[Tuple[int, str, dict]], stop: threading.Event) -> bool:
+    """
+    Send reminders one phone at a time (runs in a worker thread) and stamp
+    reminder_sent right after each phone's sends, so delivered reminders are
+    recorded even if the pass stops part-way. Returns False if any send failed.
+    """
+    by_phone: Dict[str, List[Tuple[int, dict]]] = {}
+    for apt_id, phone, details in reminders:
+        by_phone.setdefault(phone, []).append((apt_id, details))
+
+    all_sent = True
+    db = get_db_session()
+    try:
+        for phone, group in by_phone.items():
+            if stop.is_set():
+                # Shutting down; the rest are picked up by the next pass
+                return False
+
+            # One bulk send per phone, so the client opens the chat once
+            results = handler.send_reminders([(phone, details) for _, details in group])
+
+            sent_ids = []
+            for (apt_id, _), sent in zip(group, results):
+                if sent:
+                    logger.info(f"Reminder sent for appointment {apt_id}")
+                    sent_ids.append(apt_id)
+                else:
+                    logger.error(f"Reminder failed for appointment {apt_id}")
+                    all_sent = False
+
+            if sent_ids:
+                try:
+                    db.execute(
+                        update(Appointment)
+                        .where(Appointment.id.in_(sent_ids))
+                        .values(reminder_sent=datetime.now())
                     )
-                    .all()
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"Failed to mark {len(sent_ids)} reminders as sent: {e}")
+                    db.rollback()
+                    all_sent = False
+    finally:
+        db.close()
+
+    return all_sent
+
+
+async def send_due_reminders() -> bool:
+    """Send reminders for tomorrow's appointments. Returns False if any send failed"""
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    db = get_db_session()
+    try:
+        appointments = db.execute(
+            lambda_stmt(
+                lambda: select(Appointment)
+                .join(Patient)
+                .options(contains_eager(Appointment.patient))
+                .where(
+                    Appointment.date == tomorrow,
+                    Appointment.status.in_(["pending", "confirmed"]),
+                    Appointment.reminder_sent.is_(None),
                 )
+            )
+        ).scalars().all()
+
+        # Read ORM attributes here, on the loop thread that owns the session
+        reminders = [
+            (
+                apt.id,
+                apt.patient.phone,
+                {
+                    "date": apt.date.strftime("%A, %B %d, %Y"),
+                    "time": apt.time.strftime("%I:%M %p"),
+                    "name": apt.patient.name,
+                },
+            )
+            for apt in appointments
+        ]
+    finally:
+        db.close()
+
+    if not reminders:
+        return True
+
+    logger.info(f"Sending reminders for {len(reminders)} appointments")
+    handler = get_whatsapp_handler()
+
+    stop = threading.Event()
+    delivery = asyncio.ensure_future(
+        asyncio.to_thread(_deliver_reminders, handler, reminders, stop)
+    )
+    try:
+        return await asyncio.shield(delivery)
+    except asyncio.CancelledError:
+        # Shutdown: finish (and stamp) the chat in progress before the client is closed
+        stop.set()
+        await delivery
+        raise
 
-                if appointments:
-                    logger.info(f"Sending reminders for {len(appointments)} appointments")
-                    handler = get_whatsapp_handler()
-
-                    for apt in appointments:
-                        try:
-                            details = {
-                                "date": apt.date.strftime("%A, %B %d, %Y"),
-                                "time": apt.time.strftime("%I:%M %p"),
-                                "name": apt.patient.name,
-                            }
-                            handler.send_reminder(apt.patient.phone, details)
-                            apt.reminder_sent = datetime.now()
-                            db.commit()
-                            logger.info(f"Reminder sent for appointment {apt.id}")
-                        except Exception as e:
-                            logger.error(f"Reminder failed for appointment {apt.id}: {e}")
-                            db.rollback()
-            finally:
-                db.close()
 
-        except Exception as e:
-            logger.error(f"Error in reminder loop: {e}")
+async def send_reminders_loop():
+    """
+    Background task: send appointment reminders 24h in advance.
+    Runs a pass at startup, whenever an appointment is booked or changed,
+    and at midnight when a new day's appointments become due.
+    """
+    logger.info("Reminder service started")
+
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+
+    def on_appointments_changed():
+        # Booking happens in worker threads; hop onto the loop to set the event
+        loop.call_soon_threadsafe(wakeup.set)
+
+    add_appointment_listener(on_appointments_changed)
+    try:
+        while True:
+            wakeup.clear()
+            try:
+                all_sent = await send_due_reminders()
+            except Exception as e:
+                logger.error(f"Error in reminder loop: {e}")
+                all_sent = False
 
-        await asyncio.sleep(3600)  # Check every hour
+            timeout = _seconds_until_midnight()
+            if not all_sent:
+                timeout = min(timeout, REMINDER_RETRY_SECONDS)
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        remove_appointment_listener(on_appointments_changed)
 
 
 @asynccontextmanager
@@ -86,7 +196,22 @@ async def lifespan(app: FastAPI):
     logger.info("Starting AI Clinic Receptionist...")
     init_db()
 
+    # Build the handler (and its WhatsApp client) once, before the first request.
+    # In real mode this starts Chrome, so keep it off the event loop.
+    app.state.handler = await asyncio.to_thread(get_whatsapp_handler)
+
+    # Warm optional speech models so the first voice request doesn't pay the load
+    if os.getenv("STT_ENABLED", "false").lower() == "true":
+        stt = get_stt()
+        if stt.enabled:
+            await asyncio.to_thread(stt.load_model, os.getenv("WHISPER_MODEL", "base"))
+    if os.getenv("TTS_ENABLED", "false").lower() == "true":
+        tts = get_tts()
+        if tts.enabled:
+            await asyncio.to_thread(tts.load_voices)
+
     reminder_task = asyncio.create_task(send_reminders_loop())
+    writer_task = asyncio.create_task(run_conversation_writer())
 
     port = os.getenv("API_PORT", 8000)
     logger.info("=" * 60)
@@ -101,11 +226,16 @@ async def lifespan(app: FastAPI):
     yield
 
     logger.info("Shutting down...")
-    reminder_task.cancel()
-    try:
-        await reminder_task
-    except asyncio.CancelledError:
-        pass
+    for task in (reminder_task, writer_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    # Deliver anything still queued before the browser session goes away
+    await app.state.handler.send_queue.flush()
+    close_whatsapp_client()
 
 
 app = FastAPI(
@@ -124,7 +254,10 @@ app.add_middleware(
 )
 
 app.include_router(router)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+
+# Behind nginx (see nginx.conf) static files are served from disk; set SERVE_STATIC=false there
+if os.getenv("SERVE_STATIC", "true").lower() == "true":
+    app.mount("/static", StaticFiles(directory="static"), name="static")
 
 
 @app.get("/health")
@@ -133,6 +266,7 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "whatsapp_mode": os.getenv("WHATSAPP_MODE", "stub"),
+        "whatsapp_send_failures": app.state.handler.send_queue.failed_count,
         "llm_provider": os.getenv("LLM_PROVIDER", "gemini"),
     }
 
@@ -200,6 +334,9 @@ def main():
             host=args.host,
             port=args.port,
             reload=False,
+            # loop/http stay "auto": uvloop and httptools (uvicorn[standard]) are used when installed
+            # Trust X-Forwarded-* from the nginx proxy (FORWARDED_ALLOW_IPS, default 127.0.0.1)
+            proxy_headers=True,
             log_level=os.getenv("LOG_LEVEL", "info").lower(),
         )
 
@@ -1,5 +1,5 @@
 """
-Speech-to-Text using Whisper (Optional for MVP)
+Speech-to-Text using Whisper via faster-whisper (Optional for MVP)
 Can be used for voice calls in future
 """
 
@@ -8,21 +8,25 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# int8 on CPU (use "int8_float16" with WHISPER_DEVICE=cuda)
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+
 
 class WhisperSTT:
-    """Whisper Speech-to-Text handler"""
+    """Whisper Speech-to-Text handler (CTranslate2 backend)"""
     
     def __init__(self):
         self.model = None
         self.enabled = False
         
         try:
-            import whisper
-            self.whisper = whisper
+            from faster_whisper import WhisperModel
+            self.WhisperModel = WhisperModel
             self.enabled = True
             logger.info("Whisper STT available (not loaded yet)")
         except ImportError:
-            logger.warning("Whisper not installed. STT disabled. Install with: pip install openai-whisper")
+            logger.warning("faster-whisper not installed. STT disabled. Install with: pip install faster-whisper")
     
     def load_model(self, model_size="base"):
         """Load Whisper model (lazy loading)"""
@@ -30,8 +34,13 @@ class WhisperSTT:
             raise RuntimeError("Whisper not installed")
         
         if self.model is None:
-            logger.info(f"Loading Whisper model: {model_size}")
-            self.model = self.whisper.load_model(model_size)
+            logger.info(f"Loading Whisper model: {model_size} ({WHISPER_DEVICE}, {WHISPER_COMPUTE_TYPE})")
+            self.model = self.WhisperModel(
+                model_size,
+                device=WHISPER_DEVICE,
+                compute_type=WHISPER_COMPUTE_TYPE,
+                cpu_threads=os.cpu_count() or 0,
+            )
             logger.info("Whisper model loaded")
     
     def transcribe(self, audio_path: str, language: str = None) -> str:
@@ -46,21 +55,17 @@ class WhisperSTT:
             Transcribed text
         """
         if not self.enabled:
-            return "[STT not available - Whisper not installed]"
+            return "[STT not available - faster-whisper not installed]"
         
         try:
             # Lazy load model
             if self.model is None:
                 self.load_model()
             
-            # Transcribe
-            result = self.model.transcribe(
-                audio_path,
-                language=language,
-                fp16=False  # Use fp32 for CPU compatibility
-            )
+            # Transcribe - segments is a lazy generator, decoding happens while joining
+            segments, _info = self.model.transcribe(audio_path, language=language)
             
-            text = result["text"].strip()
+            text = "".join(segment.text for segment in segments).strip()
             logger.info(f"Transcribed: {text[:50]}...")
             
             return text
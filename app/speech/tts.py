@@ -1,79 +1,173 @@
 """
-Text-to-Speech using gTTS (Optional for MVP)
-Simple and free - works well for both English and Urdu
+Text-to-Speech using Piper (local) with gTTS fallback (Optional for MVP)
+Piper runs on-device via ONNX Runtime - no network round-trip per synthesis.
+gTTS is used for languages without a configured Piper voice (e.g. Urdu).
 """
 
+import hashlib
+import io
 import logging
 import os
+import wave
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Piper voice model (.onnx) per language code; leave empty to use gTTS for that language
+PIPER_VOICES = {
+    "en": os.getenv("PIPER_VOICE_EN", ""),
+    "ur": os.getenv("PIPER_VOICE_UR", ""),
+}
+
+# On-disk cache of synthesized audio (used when diskcache is installed)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+
 
 class SimpleTTS:
-    """Simple TTS using gTTS (Google Text-to-Speech)"""
-    
+    """Simple TTS - Piper voices when available, gTTS (Google Text-to-Speech) otherwise"""
+
     def __init__(self):
         self.enabled = False
-        
+        self.gTTS = None
+        self.PiperVoice = None
+        self._voices = {}
+        self._cache = None
+
+        try:
+            from piper import PiperVoice
+            self.PiperVoice = PiperVoice
+            if any(PIPER_VOICES.values()):
+                self.enabled = True
+                logger.info("Piper available for local text-to-speech")
+            else:
+                logger.info("Piper installed but no voice configured (set PIPER_VOICE_EN / PIPER_VOICE_UR)")
+        except ImportError:
+            logger.info("Piper not installed. Install with: pip install piper-tts")
+
         try:
             from gtts import gTTS
             self.gTTS = gTTS
             self.enabled = True
             logger.info("gTTS available for text-to-speech")
         except ImportError:
-            logger.warning("gTTS not installed. TTS disabled. Install with: pip install gtts")
-    
+            logger.warning("gTTS not installed. Install with: pip install gtts")
+
+        if not self.enabled:
+            logger.warning("No usable TTS engine (gTTS or a Piper voice). TTS disabled.")
+            return
+
+        try:
+            from diskcache import Cache
+            self._cache = Cache(TTS_CACHE_DIR)
+            logger.info(f"TTS cache enabled at {TTS_CACHE_DIR}")
+        except ImportError:
+            logger.info("diskcache not installed. TTS results will not be cached")
+
+    def _get_piper_voice(self, language: str):
+        """Load (once) and return the Piper voice for a language, or None"""
+        if self.PiperVoice is None:
+            return None
+
+        model_path = PIPER_VOICES.get(language)
+        if not model_path:
+            return None
+
+        if language not in self._voices:
+            logger.info(f"Loading Piper voice for '{language}': {model_path}")
+            self._voices[language] = self.PiperVoice.load(model_path)
+        return self._voices[language]
+
+    def load_voices(self):
+        """Load every configured Piper voice now, so the first synthesis doesn't pay for it"""
+        for language, model_path in PIPER_VOICES.items():
+            if not model_path:
+                continue
+            try:
+                self._get_piper_voice(language)
+            except Exception as e:
+                logger.error(f"Failed to load Piper voice for '{language}': {e}")
+
+    @staticmethod
+    def _write_wav(voice, text: str, fp):
+        """Synthesize with Piper into a WAV file object"""
+        with wave.open(fp, "wb") as wav_file:
+            # piper-tts >= 1.3 renamed the WAV writer to synthesize_wav
+            if hasattr(voice, "synthesize_wav"):
+                voice.synthesize_wav(text, wav_file)
+            else:
+                voice.synthesize(text, wav_file)
+
+    def _cache_key(self, text: str, language: str) -> str:
+        """Cache key covering the engine/voice that would render this text"""
+        voice_id = PIPER_VOICES.get(language) if self.PiperVoice is not None else ""
+        engine = f"piper:{voice_id}" if voice_id else "gtts"
+        return hashlib.sha256(f"{engine}|{language}|{text}".encode()).hexdigest()
+
     def synthesize(self, text: str, output_path: str, language: str = "en") -> bool:
         """
         Convert text to speech and save to file
-        
+
         Args:
             text: Text to convert
-            output_path: Where to save audio file
+            output_path: Where to save audio file (WAV for Piper voices, MP3 for gTTS)
             language: Language code ('en' for English, 'ur' for Urdu)
-            
+
         Returns:
             True if successful
         """
         if not self.enabled:
             logger.warning("TTS not available")
             return False
-        
+
+        audio = self.synthesize_to_bytes(text, language)
+        if audio is None:
+            return False
+
         try:
-            # Create TTS object
-            tts = self.gTTS(text=text, lang=language, slow=False)
-            
-            # Save to file
-            tts.save(output_path)
-            
+            with open(output_path, "wb") as f:
+                f.write(audio)
+
             logger.info(f"TTS generated: {output_path}")
             return True
-            
+
         except Exception as e:
             logger.error(f"TTS synthesis failed: {e}")
             return False
-    
+
     def synthesize_to_bytes(self, text: str, language: str = "en") -> Optional[bytes]:
         """
         Convert text to speech and return as bytes
-        Useful for streaming
+        Useful for streaming (WAV for Piper voices, MP3 for gTTS).
+        Repeated (text, language) pairs are served from the disk cache.
         """
         if not self.enabled:
             return None
-        
+
+        key = None
+        if self._cache is not None:
+            key = self._cache_key(text, language)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
         try:
-            import io
-            
-            tts = self.gTTS(text=text, lang=language, slow=False)
-            
-            # Save to bytes buffer
             fp = io.BytesIO()
-            tts.write_to_fp(fp)
-            fp.seek(0)
-            
-            return fp.read()
-            
+
+            voice = self._get_piper_voice(language)
+            if voice is not None:
+                self._write_wav(voice, text, fp)
+            elif self.gTTS is not None:
+                tts = self.gTTS(text=text, lang=language, slow=False)
+                tts.write_to_fp(fp)
+            else:
+                logger.warning(f"No TTS voice available for language '{language}'")
+                return None
+
+            audio = fp.getvalue()
+            if key is not None:
+                self._cache.set(key, audio)
+            return audio
+
         except Exception as e:
             logger.error(f"TTS synthesis failed: {e}")
             return None
@@ -0,0 +1,98 @@
+"""
+Batching send queue for outbound WhatsApp messages
+Sends enqueued while a batch is in flight are coalesced and handed to the
+client's send_messages, which opens each chat once per batch, not per message.
+"""
+
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, List, Optional, Tuple
+
+from app.whatsapp.client import WhatsAppClient
+
+logger = logging.getLogger(__name__)
+
+
+class BatchingSendQueue:
+    """Collects outbound messages and flushes them in batches off the event loop"""
+
+    def __init__(self, client: WhatsAppClient):
+        self.client = client
+        self._pending: Deque[Tuple[str, str, Future]] = deque()
+        self._pending_lock = threading.Lock()
+        self._flush_scheduled = False
+        self._flush_lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks = set()
+        # Messages the client failed to deliver since startup (reported by /health)
+        self.failed_count = 0
+
+    def enqueue(self, phone: str, message: str) -> Future:
+        """
+        Queue a message for sending. Safe to call from the event loop or worker threads.
+        Without a running event loop (console / demo mode) the message is sent immediately.
+
+        Returns a concurrent.futures.Future resolved with True once the message is
+        delivered, or False if the client failed to send it.
+        """
+        delivered: Future = Future()
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+
+        loop = self._loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            self._send_batch([(phone, message, delivered)])
+            return delivered
+
+        with self._pending_lock:
+            self._pending.append((phone, message, delivered))
+            if self._flush_scheduled:
+                return delivered
+            self._flush_scheduled = True
+
+        loop.call_soon_threadsafe(self._start_flush)
+        return delivered
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self.flush())
+        # Keep a reference so the task isn't garbage collected mid-flush
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """Send everything queued so far, including messages added while sending"""
+        loop = asyncio.get_running_loop()
+        async with self._flush_lock:
+            while True:
+                with self._pending_lock:
+                    if not self._pending:
+                        self._flush_scheduled = False
+                        return
+                    batch, self._pending = self._pending, deque()
+
+                # Client sends are blocking (Selenium); keep them off the loop
+                await loop.run_in_executor(None, self._send_batch, batch)
+
+    def _send_batch(self, batch: List[Tuple[str, str, Future]]):
+        if len(batch) > 1:
+            logger.debug(f"Flushing {len(batch)} queued messages")
+
+        try:
+            results = self.client.send_messages([(phone, message) for phone, message, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to send {len(batch)} messages: {e}")
+            results = [False] * len(batch)
+
+        failed = results.count(False)
+        if failed:
+            logger.error(f"{failed} of {len(batch)} queued messages failed to send")
+            with self._pending_lock:
+                self.failed_count += failed
+
+        for (_, _, delivered), sent in zip(batch, results):
+            delivered.set_result(bool(sent))
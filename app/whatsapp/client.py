@@ -4,13 +4,35 @@ WhatsApp Client - Stub (console) and Real (Selenium) modes
 
 import os
 import logging
+import time
+import threading
+from collections import deque
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+    from webdriver_manager.chrome import ChromeDriverManager
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Selenium timeouts (seconds). Shorter values fail faster on a slow connection
+# but stop a stalled WhatsApp Web page from holding up every queued send.
+WHATSAPP_WAIT_TIMEOUT = float(os.getenv("WHATSAPP_WAIT_TIMEOUT", "10"))
+WHATSAPP_PAGE_LOAD_TIMEOUT = float(os.getenv("WHATSAPP_PAGE_LOAD_TIMEOUT", "10"))
+# Headless needs an already logged-in ./whatsapp_session - the QR code can't be scanned
+WHATSAPP_HEADLESS = os.getenv("WHATSAPP_HEADLESS", "false").lower() == "true"
+
 
 class WhatsAppMessage:
     """Represents a WhatsApp message"""
@@ -27,6 +49,8 @@ class WhatsAppMessage:
 class WhatsAppClient(ABC):
     """Abstract WhatsApp client interface"""
 
+    _message_listener: Optional[Callable[[], None]] = None
+
     @abstractmethod
     def send_message(self, phone: str, message: str) -> bool:
         pass
@@ -39,12 +63,30 @@ class WhatsAppClient(ABC):
     def is_connected(self) -> bool:
         pass
 
+    def send_messages(self, items: List[Tuple[str, str]]) -> List[bool]:
+        """Send (phone, message) pairs; returns a success flag per item"""
+        return [self.send_message(phone, message) for phone, message in items]
+
+    def set_message_listener(self, callback: Optional[Callable[[], None]]):
+        """Register a callback fired (from any thread) when new messages arrive"""
+        self._message_listener = callback
+
+    def _notify_new_messages(self):
+        listener = self._message_listener
+        if listener is not None:
+            listener()
+
+    def close(self):
+        """Release any underlying session (no-op by default)"""
+        pass
+
 
 class WhatsAppStubClient(WhatsAppClient):
     """Console-based stub for testing without real WhatsApp"""
 
     def __init__(self):
-        self.message_queue = []
+        self.message_queue = deque()
+        self._queue_lock = threading.Lock()
         logger.info("WhatsApp Stub Client initialized (Console mode)")
 
     def send_message(self, phone: str, message: str) -> bool:
@@ -52,12 +94,16 @@ class WhatsAppStubClient(WhatsAppClient):
         return True
 
     def get_new_messages(self) -> List[WhatsAppMessage]:
-        messages = self.message_queue.copy()
-        self.message_queue.clear()
-        return messages
+        # Swap in a fresh queue instead of copy + clear; the lock keeps a producer
+        # from appending to the old deque after it has been handed out
+        with self._queue_lock:
+            messages, self.message_queue = self.message_queue, deque()
+        return list(messages)
 
     def add_test_message(self, phone: str, text: str):
-        self.message_queue.append(WhatsAppMessage(phone=phone, text=text))
+        with self._queue_lock:
+            self.message_queue.append(WhatsAppMessage(phone=phone, text=text))
+        self._notify_new_messages()
 
     def is_connected(self) -> bool:
         return True
@@ -70,81 +116,156 @@ class WhatsAppSeleniumClient(WhatsAppClient):
     NOT production-grade - use WhatsApp Business API for production.
     """
 
+    # Locators as (By.XPATH, ...) pairs; "xpath" is By.XPATH, spelled out so the
+    # class still imports when Selenium isn't installed
+    _MSG_BOX = ("xpath", '//div[@contenteditable="true"][@data-tab="10"]')
+    _PANE = ("xpath", '//div[@id="pane-side"]')
+    # How long an is_connected() result is reused before querying the DOM again
+    _CONNECTED_TTL_SECONDS = 5.0
+
+    # Insert the whole message in one WebDriver call instead of one per keystroke
+    _INSERT_TEXT_JS = (
+        "const el = arguments[0], txt = arguments[1];"
+        "el.focus();"
+        "document.execCommand('insertText', false, txt);"
+    )
+
     def __init__(self):
-        try:
-            from selenium import webdriver
-            from selenium.webdriver.chrome.service import Service as ChromeService
-            from webdriver_manager.chrome import ChromeDriverManager
-            from selenium.webdriver.common.by import By
-            from selenium.webdriver.support.ui import WebDriverWait
-
-            self.By = By
-            self.WebDriverWait = WebDriverWait
-
-            options = webdriver.ChromeOptions()
-            options.add_argument("--user-data-dir=./whatsapp_session")
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-
-            self.driver = webdriver.Chrome(
-                service=ChromeService(ChromeDriverManager().install()),
-                options=options,
-            )
-
-            self.driver.get("https://web.whatsapp.com")
-            logger.info("WhatsApp Selenium Client initialized")
-            logger.warning("Please scan QR code if this is first time")
-
-        except ImportError:
+        if not SELENIUM_AVAILABLE:
             raise ImportError("Selenium not installed. Run: pip install selenium webdriver-manager")
 
+        # One browser session: serialize sends coming from worker threads
+        self._send_lock = threading.Lock()
+        # Chat currently open in the browser; consecutive sends to it skip the page load
+        self._current_phone = None
+        self._message_box = None
+        # (checked_at, connected) from the last is_connected DOM query
+        self._conn_cache = (0.0, False)
+
+        options = webdriver.ChromeOptions()
+        options.add_argument("--user-data-dir=./whatsapp_session")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        # Skip work WhatsApp Web doesn't need for sending text
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        # Return from driver.get at DOMContentLoaded; the chat box is waited for explicitly
+        options.page_load_strategy = "eager"
+        if WHATSAPP_HEADLESS:
+            options.add_argument("--headless=new")
+
+        self.driver = webdriver.Chrome(
+            service=ChromeService(ChromeDriverManager().install()),
+            options=options,
+        )
+        # Poll every 50ms instead of the default 500ms so sends proceed as soon as the chat renders
+        self._wait = WebDriverWait(
+            self.driver,
+            WHATSAPP_WAIT_TIMEOUT,
+            poll_frequency=0.05,
+            ignored_exceptions=(NoSuchElementException,),
+        )
+
+        self.driver.get("https://web.whatsapp.com")
+        # The first load (and QR login) may take a while; bound later chat navigations
+        self.driver.set_page_load_timeout(WHATSAPP_PAGE_LOAD_TIMEOUT)
+        logger.info("WhatsApp Selenium Client initialized")
+        logger.warning("Please scan QR code if this is first time")
+
     def send_message(self, phone: str, message: str) -> bool:
+        with self._send_lock:
+            return self._send_message(phone, message)
+
+    def send_messages(self, items: List[Tuple[str, str]]) -> List[bool]:
+        """Send a batch grouped by phone, so each chat is opened once"""
+        by_phone: Dict[str, List[int]] = {}
+        for i, (phone, _) in enumerate(items):
+            by_phone.setdefault(phone, []).append(i)
+
+        results = [False] * len(items)
+        for phone, indexes in by_phone.items():
+            # Lock per chat, not per batch, so queued replies can interleave with a long run
+            with self._send_lock:
+                for i in indexes:
+                    results[i] = self._send_message(phone, items[i][1])
+        return results
+
+    def _send_message(self, phone: str, message: str) -> bool:
         try:
-            from selenium.webdriver.support import expected_conditions as EC
-
             phone_clean = phone.replace(" ", "").replace("-", "")
-            url = f"https://web.whatsapp.com/send?phone={phone_clean}"
-            self.driver.get(url)
+            message_box = self._get_message_box(phone_clean)
 
-            wait = self.WebDriverWait(self.driver, 30)
-            message_box = wait.until(
-                EC.presence_of_element_located(
-                    (self.By.XPATH, '//div[@contenteditable="true"][@data-tab="10"]')
-                )
-            )
-
-            message_box.click()
-            message_box.send_keys(message)
-
-            send_button = self.driver.find_element(
-                self.By.XPATH, '//button[@data-tab="11"]'
-            )
-            send_button.click()
+            self.driver.execute_script(self._INSERT_TEXT_JS, message_box, message)
+            message_box.send_keys(Keys.ENTER)
 
             logger.info(f"Message sent to {phone}")
             return True
 
         except Exception as e:
             logger.error(f"Failed to send message: {e}")
+            # Page state is unknown now; reload the chat on the next send
+            self._current_phone = None
             return False
 
+    def _get_message_box(self, phone_clean: str):
+        """Open the chat for a phone (only if it isn't already open) and return its message box"""
+        if phone_clean == self._current_phone:
+            try:
+                self._message_box.is_enabled()
+                return self._message_box
+            except StaleElementReferenceException:
+                # The chat was switched or re-rendered (e.g. someone clicked another chat in
+                # the visible browser); never type into whatever chat is open now
+                self._current_phone = None
+
+        self._current_phone = None
+        self.driver.get(f"https://web.whatsapp.com/send?phone={phone_clean}")
+        self._message_box = self._wait.until(EC.presence_of_element_located(self._MSG_BOX))
+        self._current_phone = phone_clean
+        return self._message_box
+
     def get_new_messages(self) -> List[WhatsAppMessage]:
         return []
 
     def is_connected(self) -> bool:
+        now = time.monotonic()
+        checked_at, connected = self._conn_cache
+        if now - checked_at < self._CONNECTED_TTL_SECONDS:
+            return connected
+
+        # The chat pane only renders once the session is logged in
         try:
-            self.driver.find_element(self.By.XPATH, '//div[@id="pane-side"]')
-            return True
-        except Exception:
-            return False
+            self.driver.find_element(*self._PANE)
+            connected = True
+        except NoSuchElementException:
+            connected = False
+
+        self._conn_cache = (now, connected)
+        return connected
 
     def close(self):
         if hasattr(self, "driver"):
             self.driver.quit()
 
 
+# Global singleton - one browser session / connection shared by all senders
+_client = None
+# Creating a Selenium client starts Chrome; never let two callers race to do it
+_client_lock = threading.Lock()
+
+
 def get_whatsapp_client() -> WhatsAppClient:
-    """Get WhatsApp client based on WHATSAPP_MODE env var"""
+    """Get or create the WhatsApp client for the WHATSAPP_MODE env var"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_whatsapp_client()
+    return _client
+
+
+def _create_whatsapp_client() -> WhatsAppClient:
     mode = os.getenv("WHATSAPP_MODE", "stub").lower()
 
     if mode == "stub":
@@ -154,3 +275,12 @@ def get_whatsapp_client() -> WhatsAppClient:
     else:
         logger.warning(f"Invalid WHATSAPP_MODE: {mode}, falling back to stub")
         return WhatsAppStubClient()
+
+
+def close_whatsapp_client():
+    """Close the shared WhatsApp client, if one was created"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
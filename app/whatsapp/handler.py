@@ -3,76 +3,219 @@ WhatsApp Message Handler
 Routes incoming messages through the AI agent and sends responses
 """
 
+import os
+import sys
+import time
 import logging
 import asyncio
-
-from app.whatsapp.client import get_whatsapp_client
-from app.agent.clinic_agent import chat_with_agent
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.whatsapp.client import WhatsAppMessage, get_whatsapp_client
+from app.whatsapp.batch_queue import BatchingSendQueue
+from app.agent.clinic_agent import (
+    ERROR_RESPONSE,
+    FALLBACK_RESPONSE,
+    achat_with_agent,
+    chat_with_agent,
+)
+
+if sys.version_info >= (3, 11):
+    from asyncio import timeout as async_timeout
+else:
+    from async_timeout import timeout as async_timeout
 
 logger = logging.getLogger(__name__)
 
+# Fallback poll interval when the client doesn't signal new messages
+LISTEN_IDLE_SECONDS = float(os.getenv("LISTEN_IDLE_SECONDS", "30"))
+# Conversations handled in parallel by the listen loop (each is one in-flight LLM call)
+LISTEN_CONCURRENCY = int(os.getenv("LISTEN_CONCURRENCY", "8"))
+# Phones whose last (message, reply) is kept to answer delivery retries / double sends
+RECENT_REPLIES_MAX = 256
+
+# Outbound templates, filled from the details dict ('name', 'date', 'time')
+# via _TemplateDetails, so a missing key renders as None instead of raising
+CONFIRMATION_TEMPLATE = (
+    "Appointment Confirmed\n\n"
+    "Patient: %(name)s\n"
+    "Date: %(date)s\n"
+    "Time: %(time)s\n\n"
+    "Please arrive 10 minutes early.\n"
+    "For cancellation, contact the clinic."
+)
+REMINDER_TEMPLATE = (
+    "Appointment Reminder\n\n"
+    "Dear %(name)s, you have an appointment tomorrow:\n"
+    "Date: %(date)s\n"
+    "Time: %(time)s\n\n"
+    "Please confirm or call to reschedule."
+)
+
+
+class _TemplateDetails(dict):
+    """Details mapping for the templates - missing keys read as None, like dict.get()"""
+
+    def __missing__(self, key):
+        return None
+
 
 class WhatsAppHandler:
     """Handles WhatsApp message processing"""
 
     def __init__(self):
         self.client = get_whatsapp_client()
+        self.send_queue = BatchingSendQueue(self.client)
         self.running = False
+        # Set when the client reports incoming messages
+        self._wake = asyncio.Event()
+        self._sem = asyncio.Semaphore(LISTEN_CONCURRENCY)
+        # Latest in-flight task per phone; a phone's messages are chained in order
+        self._phone_tasks: Dict[str, asyncio.Task] = {}
+        # phone -> (message, minute, reply) for the last message from that phone
+        self._recent: "OrderedDict[str, Tuple[str, int, str]]" = OrderedDict()
+        self._recent_lock = threading.Lock()
         logger.info("WhatsApp Handler initialized")
 
     def process_message(self, phone: str, message: str) -> str:
-        """Process a single message through the AI agent"""
+        """
+        Process a single message through the AI agent
+        The reply goes through send_queue. Without a running event loop (console, demo)
+        it is sent before this returns; on the loop thread it is delivered afterwards, and
+        a failed send is only logged and counted in send_queue.failed_count.
+        """
         try:
             logger.info(f"Processing message from {phone}: {message[:50]}...")
 
-            response = chat_with_agent(phone=phone, message=message)
-            self.client.send_message(phone=phone, message=response)
+            response = self._recent_reply(phone, message)
+            if response is None:
+                response = chat_with_agent(phone=phone, message=message)
+                self._remember_reply(phone, message, response)
+            self.send_queue.enqueue(phone, response)
 
             return response
 
         except Exception as e:
             logger.error(f"Error processing message: {e}")
             error_msg = "Sorry, I encountered an error. Please try again or call the clinic."
-            self.client.send_message(phone=phone, message=error_msg)
+            self.send_queue.enqueue(phone, error_msg)
             return error_msg
 
+    async def aprocess_message(self, phone: str, message: str) -> str:
+        """Async variant of process_message that keeps the event loop free"""
+        response, _ = await self.areply(phone, message)
+        return response
+
+    async def areply(self, phone: str, message: str) -> Tuple[str, bool]:
+        """
+        Like aprocess_message, but waits for the (batched) send and also
+        returns whether the reply was delivered to WhatsApp
+        """
+        try:
+            logger.info(f"Processing message from {phone}: {message[:50]}...")
+
+            response = self._recent_reply(phone, message)
+            if response is None:
+                response = await achat_with_agent(phone=phone, message=message)
+                self._remember_reply(phone, message, response)
+
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            response = "Sorry, I encountered an error. Please try again or call the clinic."
+
+        delivered = await asyncio.wrap_future(self.send_queue.enqueue(phone, response))
+        if not delivered:
+            logger.error(f"Reply to {phone} was not delivered")
+        return response, delivered
+
+    def _recent_reply(self, phone: str, message: str) -> Optional[str]:
+        """Reply to this phone's previous message if it was the same text within the same minute"""
+        with self._recent_lock:
+            recent = self._recent.get(phone)
+        if recent is not None and recent[0] == message and recent[1] == int(time.time() // 60):
+            logger.info(f"Duplicate message from {phone}, re-sending previous reply")
+            return recent[2]
+        return None
+
+    def _remember_reply(self, phone: str, message: str, response: str):
+        # The agent reports failures as these canned replies; a retry must reach it again
+        if response in (ERROR_RESPONSE, FALLBACK_RESPONSE):
+            with self._recent_lock:
+                self._recent.pop(phone, None)
+            return
+        with self._recent_lock:
+            self._recent[phone] = (message, int(time.time() // 60), response)
+            self._recent.move_to_end(phone)
+            if len(self._recent) > RECENT_REPLIES_MAX:
+                self._recent.popitem(last=False)
+
     def send_confirmation(self, phone: str, details: dict):
         """Send appointment confirmation"""
-        message = (
-            "Appointment Confirmed\n\n"
-            f"Patient: {details.get('name')}\n"
-            f"Date: {details.get('date')}\n"
-            f"Time: {details.get('time')}\n\n"
-            "Please arrive 10 minutes early.\n"
-            "For cancellation, contact the clinic."
-        )
-        self.client.send_message(phone=phone, message=message)
+        self.send_queue.enqueue(phone, CONFIRMATION_TEMPLATE % _TemplateDetails(details))
 
     def send_reminder(self, phone: str, details: dict):
         """Send appointment reminder (24h before)"""
-        message = (
-            "Appointment Reminder\n\n"
-            f"Dear {details.get('name')}, you have an appointment tomorrow:\n"
-            f"Date: {details.get('date')}\n"
-            f"Time: {details.get('time')}\n\n"
-            "Please confirm or call to reschedule."
+        self.send_queue.enqueue(phone, REMINDER_TEMPLATE % _TemplateDetails(details))
+
+    def send_reminders(self, reminders: List[Tuple[str, dict]]) -> List[bool]:
+        """
+        Send a batch of reminders in one client call (blocking)
+        Returns a success flag per (phone, details) item, so callers know which were delivered.
+        """
+        return self.client.send_messages(
+            [(phone, REMINDER_TEMPLATE % _TemplateDetails(details)) for phone, details in reminders]
         )
-        self.client.send_message(phone=phone, message=message)
 
     async def listen_loop(self):
         """Listen for incoming messages (real WhatsApp mode)"""
         self.running = True
         logger.info("Starting WhatsApp listen loop")
 
-        while self.running:
-            try:
-                messages = self.client.get_new_messages()
-                for msg in messages:
-                    self.process_message(msg.phone, msg.text)
-                await asyncio.sleep(5)
-            except Exception as e:
-                logger.error(f"Error in listen loop: {e}")
-                await asyncio.sleep(10)
+        loop = asyncio.get_running_loop()
+        self.client.set_message_listener(lambda: loop.call_soon_threadsafe(self._wake.set))
+
+        try:
+            while self.running:
+                try:
+                    messages = self.client.get_new_messages()
+                    for msg in messages:
+                        self._dispatch(msg)
+                    await self._wait_for_messages()
+                except Exception as e:
+                    logger.error(f"Error in listen loop: {e}")
+                    await asyncio.sleep(10)
+        finally:
+            self.client.set_message_listener(None)
+            # Let in-flight conversations finish sending their replies
+            if self._phone_tasks:
+                await asyncio.gather(*self._phone_tasks.values(), return_exceptions=True)
+
+    def _dispatch(self, msg: WhatsAppMessage):
+        """Process a message concurrently with other phones, after this phone's earlier ones"""
+        previous = self._phone_tasks.get(msg.phone)
+        task = asyncio.create_task(self._handle_message(msg, previous))
+        self._phone_tasks[msg.phone] = task
+        task.add_done_callback(lambda t: self._forget_task(msg.phone, t))
+
+    def _forget_task(self, phone: str, task: asyncio.Task):
+        if self._phone_tasks.get(phone) is task:
+            del self._phone_tasks[phone]
+
+    async def _handle_message(self, msg: WhatsAppMessage, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self._sem:
+            await self.aprocess_message(msg.phone, msg.text)
+
+    async def _wait_for_messages(self):
+        """Sleep until the client signals new messages, or the idle poll interval passes"""
+        try:
+            async with async_timeout(LISTEN_IDLE_SECONDS):
+                await self._wake.wait()
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
 
     def stop(self):
         self.running = False
@@ -80,11 +223,14 @@ class WhatsAppHandler:
 
 # Global singleton
 _handler = None
+_handler_lock = threading.Lock()
 
 
 def get_whatsapp_handler() -> WhatsAppHandler:
     """Get or create global WhatsApp handler"""
     global _handler
     if _handler is None:
-        _handler = WhatsAppHandler()
+        with _handler_lock:
+            if _handler is None:
+                _handler = WhatsAppHandler()
     return _handler
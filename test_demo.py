@@ -4,11 +4,15 @@ Enhanced Demo - Shows conversational AI with small talk and doctor notifications
 
 import sys
 import os
+import time
 sys.path.insert(0, os.path.dirname(__file__))
 
 from app.whatsapp.handler import get_whatsapp_handler
 from app.database.db import init_db
 
+# Pause between turns for a human watching the demo; off by default (CI / benchmarks)
+INTERACTIVE = os.getenv("DEMO_INTERACTIVE") == "1"
+
 def test_conversational_booking():
     """Test the new conversational friendly booking flow"""
     
@@ -61,8 +65,8 @@ def test_conversational_booking():
         # Response already printed by stub
         print(f"\n{'='*70}")
         
-        import time
-        time.sleep(1.5)
+        if INTERACTIVE:
+            time.sleep(1.5)
     
     print("\n\n" + "=" * 70)
     print("✅ CONVERSATIONAL DEMO COMPLETE!")